@@ -0,0 +1,30 @@
+from functools import lru_cache
+
+import boto3
+from langchain_aws import BedrockEmbeddings
+
+# --- CONFIGURATION ---
+# Shared by load_to_db.py, main.py and check_db.py, which must all agree on
+# where the vectors live and which model made them.
+COLLECTION_NAME = "municipal"
+EMBEDDING_MODEL_ID = "amazon.titan-embed-text-v2:0"
+EMBEDDING_DIMENSIONS = 512  # Titan v2 supports 256, 512 or 1024
+
+
+@lru_cache(maxsize=1)
+def get_bedrock_client():
+    """Creates the Bedrock client on first use and reuses it afterwards."""
+    return boto3.client(
+        service_name="bedrock-runtime",
+        region_name="us-east-1"
+    )
+
+
+@lru_cache(maxsize=1)
+def get_embeddings():
+    """Creates the embeddings model on first use and reuses it afterwards."""
+    return BedrockEmbeddings(
+        client=get_bedrock_client(),
+        model_id=EMBEDDING_MODEL_ID,
+        dimensions=EMBEDDING_DIMENSIONS
+    )
@@ -1,22 +1,19 @@
 import os
+
 import chromadb
-import boto3
-from langchain_aws import BedrockEmbeddings
 from langchain_chroma import Chroma
 
+from bedrock_setup import COLLECTION_NAME, get_embeddings
+
 # --- CONFIGURATION ---
 DB_PATH = "chroma_db"
 
-def check_with_direct_client():
+
+def check_with_direct_client(client):
     """Uses the chromadb client to connect and inspect the database."""
     print("\n--- Method 1: Direct ChromaDB Client Check ---")
 
-    if not os.path.exists(DB_PATH):
-        print(f"❌ Error: Database directory not found at '{DB_PATH}'")
-        return
-
     try:
-        client = chromadb.PersistentClient(path=DB_PATH)
         collections = client.list_collections()
 
         if not collections:
@@ -32,23 +29,15 @@ def check_with_direct_client():
         print(f"❌ An error occurred with the direct client: {e}")
 
 
-def check_with_langchain_wrapper():
+def check_with_langchain_wrapper(client):
     print("\n--- Method 2: LangChain Wrapper Check ---")
 
     try:
-        bedrock_client = boto3.client(
-            service_name="bedrock-runtime",
-            region_name="us-east-1"
-        )
-
-        embeddings = BedrockEmbeddings(
-            client=bedrock_client,
-            model_id="amazon.titan-embed-text-v2:0"
-        )
-
+        # Reuses the already opened client instead of loading the database again
         db = Chroma(
-            persist_directory=DB_PATH,
-            embedding_function=embeddings
+            client=client,
+            collection_name=COLLECTION_NAME,
+            embedding_function=get_embeddings()
         )
 
         print("\nRunning a test search for 'selling ice'...")
@@ -64,6 +53,13 @@ def check_with_langchain_wrapper():
 
 if __name__ == "__main__":
     print("🚀 Running Comprehensive Database Check...")
-    check_with_direct_client()
-    check_with_langchain_wrapper()
+
+    # Opening the client would create an empty database, so check first
+    if not os.path.exists(DB_PATH):
+        print(f"❌ Error: Database directory not found at '{DB_PATH}'")
+    else:
+        # Both checks share one client, so the database is only loaded once
+        client = chromadb.PersistentClient(path=DB_PATH)
+        check_with_direct_client(client)
+        check_with_langchain_wrapper(client)
     print("\n✅ Database check complete.")
\ No newline at end of file
@@ -1,15 +1,173 @@
+import hashlib
+import importlib.util
+import json
 import os
+import tempfile
 import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pymupdf
 from unstructured.partition.pdf import partition_pdf
 
 # --- CONFIGURATION ---
 PDF_PATH = "source_data/test_file.pdf"
 OCR_TEXT_CACHE = "full_text_ocr.txt"  # File to save/load OCR results
+STRATEGY_CACHE = "ocr_strategy.json"  # Remembers "fast" or "hi_res" for each page
+MIN_CHARS_PER_PAGE = 500  # Below this, a page is treated as scanned and needs OCR
+PAGES_PER_BATCH = 10  # Pages handed to each OCR worker at a time
+# Page batches processed in parallel. Each worker loads its own layout and table
+# models, so memory use grows with this; keep it small.
+OCR_WORKERS = min(4, os.cpu_count() or 1)
+# Use EasyOCR on a CUDA GPU instead of "hi_res" when available. It's optional:
+# install with `pip install easyocr`
+USE_GPU_OCR = True
+GPU_OCR_DPI = 200  # Resolution pages are rendered at for GPU OCR
+
+
+def split_pdf(pdf_path, output_dir, page_numbers, pages_per_batch=PAGES_PER_BATCH):
+    """
+    Copies the given pages (numbered from 1) into smaller PDFs.
+    Returns a (path, page numbers) pair for each new file, in page order.
+    """
+    batches = []
+    with pymupdf.open(pdf_path) as source:
+        for start in range(0, len(page_numbers), pages_per_batch):
+            batch_pages = page_numbers[start:start + pages_per_batch]
+            batch_path = os.path.join(output_dir, f"pages_{batch_pages[0]:05d}.pdf")
+            with pymupdf.open() as batch:
+                for page_number in batch_pages:
+                    batch.insert_pdf(
+                        source, from_page=page_number - 1, to_page=page_number - 1
+                    )
+                batch.save(batch_path)
+            batches.append((batch_path, batch_pages))
+    return batches
+
+
+def partition_batch(batch_path):
+    """
+    Runs OCR on one page batch.
+    Returns a (page number within the batch, text) pair for each element.
+    """
+    elements = partition_pdf(
+        filename=batch_path,
+        strategy="hi_res",  # "hi_res" is a powerful strategy
+        infer_table_structure=True,
+        model_name="yolox"
+    )
+    return [(el.metadata.page_number or 1, str(el)) for el in elements]
+
+
+def extract_fast_pages():
+    """
+    Reads the PDF's embedded text layer without OCR.
+    Returns the text of each page. Much faster than "hi_res", but finds
+    little text on scanned pages and loses table structure.
+    """
+    # PyMuPDF never falls back to OCR, unlike unstructured's "fast" strategy,
+    # which OCRs the whole file on one core when no page has a text layer
+    with pymupdf.open(PDF_PATH) as pdf:
+        return [page.get_text() for page in pdf]
+
+
+def strategy_cache_key():
+    """
+    Identifies the PDF and the settings the page strategies were chosen with,
+    so a different file or a new MIN_CHARS_PER_PAGE never reuses old choices.
+    """
+    sha256 = hashlib.sha256()
+    with open(PDF_PATH, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(block)
+    return {"pdf_sha256": sha256.hexdigest(), "min_chars_per_page": MIN_CHARS_PER_PAGE}
+
+
+def choose_page_strategies(fast_pages):
+    """
+    Picks "fast" or "hi_res" for each page.
+    Scanned pages (little embedded text) and pages with tables need "hi_res";
+    every other page keeps the text from the fast pass.
+    """
+    with pymupdf.open(PDF_PATH) as pdf:
+        # PyMuPDF's table finder is rule-based, so it's cheap compared to yolox
+        table_pages = {page.number + 1 for page in pdf if page.find_tables().tables}
+
+    return [
+        "hi_res" if len(text) < MIN_CHARS_PER_PAGE or page_number in table_pages
+        else "fast"
+        for page_number, text in enumerate(fast_pages, start=1)
+    ]
+
+
+def gpu_ocr_available():
+    """Checks whether EasyOCR is installed and a CUDA GPU can be used."""
+    if not USE_GPU_OCR or importlib.util.find_spec("easyocr") is None:
+        return False
+    # torch takes seconds to import, so only runs that need OCR pay for it
+    import torch
+    return torch.cuda.is_available()
+
+
+def extract_gpu_ocr_pages(page_numbers):
+    """
+    Runs OCR on the GPU with EasyOCR, one rendered page at a time.
+    Much faster than "hi_res", but doesn't detect table structure.
+    Returns a dict of page number -> text.
+    """
+    import easyocr
+
+    reader = easyocr.Reader(['en'], gpu=True)
+    page_texts = {}
+    with pymupdf.open(PDF_PATH) as pdf:
+        for page_number in page_numbers:
+            pixmap = pdf[page_number - 1].get_pixmap(dpi=GPU_OCR_DPI)
+            image = np.frombuffer(pixmap.samples, dtype=np.uint8).reshape(
+                pixmap.height, pixmap.width, pixmap.n
+            )
+            texts = reader.readtext(image, detail=0, paragraph=True)
+            page_texts[page_number] = "\n\n".join(texts)
+    return page_texts
+
+
+def extract_hi_res_pages(page_numbers):
+    """
+    Runs OCR with the "hi_res" strategy on the given pages.
+    Returns a dict of page number -> text, and the number of batches that failed.
+    """
+    # Pages are independent, so they are split into batches that are
+    # processed in parallel and then matched back to their page numbers.
+    page_texts = {}
+    failed_batches = 0
+    with tempfile.TemporaryDirectory() as batch_dir:
+        batches = split_pdf(PDF_PATH, batch_dir, page_numbers)
+        workers = min(len(batches), OCR_WORKERS)
+        print(f"🔀 Processing {len(batches)} batches of up to "
+              f"{PAGES_PER_BATCH} pages with {workers} workers...")
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(partition_batch, path) for path, _ in batches]
+            for (path, batch_pages), future in zip(batches, futures):
+                # A bad batch is skipped so it doesn't throw away the rest of the run
+                try:
+                    elements = future.result()
+                except Exception as e:
+                    failed_batches += 1
+                    print(f"⚠️  Skipping '{os.path.basename(path)}': {e}")
+                    continue
+
+                texts = {page_number: [] for page_number in batch_pages}
+                for batch_page_number, text in elements:
+                    texts[batch_pages[batch_page_number - 1]].append(text)
+                for page_number, page_text in texts.items():
+                    page_texts[page_number] = "\n\n".join(page_text)
+
+    return page_texts, failed_batches
 
 
 def get_ocr_text():
     """
-    Performs OCR and saves the result to a cache file.
+    Extracts the PDF's text and saves the result to a cache file.
     If the cache file already exists, it loads from there instead.
     """
     # 1. VALIDATE PDF PATH: Check if the source PDF file exists.
@@ -24,25 +182,76 @@ def get_ocr_text():
         with open(OCR_TEXT_CACHE, 'r', encoding='utf-8') as f:
             return f.read()
 
-    # If cache doesn't exist, run the OCR process
-    print(f"📜 No cache found. Starting OCR process on '{PDF_PATH}'...")
-    print("This may take a few minutes...")
-    
+    # If cache doesn't exist, extract the text
+    print(f"📜 No cache found. Starting text extraction on '{PDF_PATH}'...")
     start_time = time.time()
 
-    # Use unstructured's partition_pdf with an OCR strategy.
-    # This will automatically use OCR when text extraction is difficult.
-    elements = partition_pdf(
-        filename=PDF_PATH,
-        strategy="hi_res",  # "hi_res" is a powerful strategy
-        infer_table_structure=True,
-        model_name="yolox"
-    )
+    # 3. FAST PASS: Read the embedded text layer of every page.
+    print("⚡ Reading the embedded text layer...")
+    fast_pages = extract_fast_pages()
+
+    # 4. CHOOSE A STRATEGY PER PAGE: Reuse the previous choice if there is one.
+    strategies = None
+    cache_key = strategy_cache_key()
+    if os.path.exists(STRATEGY_CACHE):
+        with open(STRATEGY_CACHE, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        # Only reuse choices made for this exact PDF and these settings
+        if isinstance(cached, dict) and cached.get("key") == cache_key:
+            strategies = cached["strategies"]
+            print(f"✅ Using cached page strategies from '{STRATEGY_CACHE}'.")
 
-    full_text = "\n\n".join([str(el) for el in elements])
+    if strategies is None:
+        print("🔎 Looking for scanned pages and tables...")
+        strategies = choose_page_strategies(fast_pages)
+        with open(STRATEGY_CACHE, 'w', encoding='utf-8') as f:
+            json.dump({"key": cache_key, "strategies": strategies}, f)
+
+    hi_res_pages = [
+        page_number for page_number, strategy in enumerate(strategies, start=1)
+        if strategy == "hi_res"
+    ]
+    print(f"📏 {len(hi_res_pages)} of {len(strategies)} pages need OCR "
+          "or table detection.")
+
+    # 5. OCR: Only scanned and table pages pay for it.
+    page_texts = dict(enumerate(fast_pages, start=1))
+    failed_batches = 0
+    if hi_res_pages:
+        print("This may take a few minutes...")
+        if gpu_ocr_available():
+            # Scanned pages go to the GPU; pages with a text layer are only
+            # here for their tables, which only "hi_res" can detect
+            scanned_pages = [
+                page_number for page_number in hi_res_pages
+                if len(fast_pages[page_number - 1]) < MIN_CHARS_PER_PAGE
+            ]
+            hi_res_pages = [
+                page_number for page_number in hi_res_pages
+                if page_number not in scanned_pages
+            ]
+            # Skip loading EasyOCR's models when every page is here for a table
+            if scanned_pages:
+                print(f"🎮 CUDA GPU found. Running OCR on {len(scanned_pages)} "
+                      "scanned pages with EasyOCR...")
+                page_texts.update(extract_gpu_ocr_pages(scanned_pages))
+
+        if hi_res_pages:
+            hi_res_texts, failed_batches = extract_hi_res_pages(hi_res_pages)
+            page_texts.update(hi_res_texts)
+
+    full_text = "\n\n".join(
+        page_texts[page_number] for page_number in sorted(page_texts)
+        if page_texts[page_number]
+    )
 
     end_time = time.time()
-    print(f"⏱️ OCR process finished in {end_time - start_time:.2f} seconds.")
+    print(f"⏱️ Text extraction finished in {end_time - start_time:.2f} seconds.")
+
+    # Don't cache partial results, so the next run retries the failed batches
+    if failed_batches:
+        print(f"⚠️  {failed_batches} batch(es) failed. Not saving the cache file.")
+        return full_text
 
     print(f"💾 Saving OCR text to cache file: '{OCR_TEXT_CACHE}'")
     with open(OCR_TEXT_CACHE, 'w', encoding='utf-8') as f:
@@ -1,16 +1,157 @@
+import hashlib
+import mmap
 import os
-import boto3
 import re
-import shutil
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice
+
+import boto3
+import chromadb
+import numpy as np
+from botocore.config import Config
 from dotenv import load_dotenv
 from langchain_aws import BedrockEmbeddings
 from langchain_chroma import Chroma
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
+from langchain_text_splitters import TokenTextSplitter
+
+from bedrock_setup import COLLECTION_NAME, EMBEDDING_DIMENSIONS, EMBEDDING_MODEL_ID
 
 # --- CONFIGURATION ---
 OCR_TEXT_PATH = "full_text_ocr.txt"
+# Section numbers in municipal code format like "12.04.010". Bytes, because the
+# text file is memory-mapped; compiled once here so every parse reuses it.
+SECTION_PATTERN = re.compile(rb'\d+\.\d+\.\d+')
 DB_PATH = "chroma_db"
+EMBEDDING_WORKERS = 10  # Number of Bedrock embedding requests sent at once
+EMBEDDING_CACHE_PATH = "embedding_cache.sqlite"  # Survives database rebuilds
+ADD_BATCH_SIZE = 1024  # Documents embedded and written to ChromaDB at a time
+MIN_SECTIONS = 10  # Fewer sections than this means the Regex didn't fit the text
+CHUNK_TOKENS = 400  # Longest chunk sent to the embedding model, in tokens
+CHUNK_OVERLAP_TOKENS = 50  # Tokens shared by neighbouring chunks of a long section
+
+# HNSW index settings for the collection, tuned for recall over memory and
+# build time. ChromaDB only applies these when the collection is created, so
+# the collection is rebuilt whenever they change.
+HNSW_SETTINGS = {
+    "hnsw:space": "cosine",
+    "hnsw:M": 32,  # Links per vector in the graph: higher = better recall, more memory
+    "hnsw:construction_ef": 256,  # Build-time search width: higher = better graph
+    "hnsw:search_ef": 100,  # Query-time search width: higher = better recall, slower
+    # Every add is already saved in ChromaDB's SQLite log, so the index file only
+    # needs writing to disk now and then. Fewer writes make bulk loads faster.
+    "hnsw:sync_threshold": 10 * ADD_BATCH_SIZE,  # Vectors added between disk writes
+}
+
+
+class ParallelBedrockEmbeddings(BedrockEmbeddings):
+    """
+    BedrockEmbeddings that embeds documents with several requests in flight.
+    Titan embeds one text per request, so most of the time is spent waiting
+    on the network; sending requests from a thread pool hides that wait.
+    """
+
+    max_workers: int = EMBEDDING_WORKERS
+
+    def _embed_document(self, text):
+        # The parent's embed_documents embeds as a document, not a query,
+        # which matters for some models, and normalizes when asked to
+        return BedrockEmbeddings.embed_documents(self, [text])[0]
+
+    def embed_documents(self, texts):
+        # Cohere models already embed many texts per request
+        if "cohere" in (self.provider or self.model_id):
+            return super().embed_documents(texts)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # map() returns the results in the same order as the texts
+            return list(executor.map(self._embed_document, texts))
+
+
+def iter_sections(text):
+    """
+    Yields one Document per section (municipal code format like "12.04.010").
+    `text` is the UTF-8 bytes of the file (e.g. memory-mapped). Each section's
+    content is sliced from it between two section numbers and decoded on its
+    own, so the whole text is never loaded or copied into a list of pieces.
+    """
+    matches = SECTION_PATTERN.finditer(text)
+    current = next(matches, None)
+    while current is not None:
+        following = next(matches, None)
+        end = following.start() if following else len(text)
+        yield Document(
+            page_content=text[current.end():end].decode('utf-8').strip(),
+            metadata={"section": current.group().decode('utf-8')}
+        )
+        current = following
+
+
+def iter_batches(items, size):
+    """Yields lists of up to `size` items."""
+    items = iter(items)
+    while batch := list(islice(items, size)):
+        yield batch
+
+
+def content_hash(text):
+    """Returns the SHA-256 hex digest of the text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def document_id(doc):
+    """Stable ID for a document, derived from its section number and text."""
+    return content_hash(f"{doc.metadata.get('section', '')}\n{doc.page_content}")
+
+
+def embedding_model_key(embeddings):
+    """Names the model and vector size, since vectors from different ones can't mix."""
+    return f"{embeddings.model_id}/{embeddings.dimensions}"
+
+
+def open_embedding_cache(path=EMBEDDING_CACHE_PATH):
+    """Opens (or creates) the SQLite file that stores previously computed vectors."""
+    cache = sqlite3.connect(path)
+    cache.execute(
+        "CREATE TABLE IF NOT EXISTS embeddings ("
+        "model_id TEXT, hash TEXT, vector BLOB, PRIMARY KEY (model_id, hash))"
+    )
+    return cache
+
+
+def embed_with_cache(texts, embeddings, cache):
+    """
+    Returns one embedding per text, plus how many came from the cache.
+    Text embedded in an earlier run is looked up by its hash; only new
+    or changed text is sent to Bedrock, and those vectors are saved.
+    """
+    hashes = [content_hash(text) for text in texts]
+    # Vectors from a different model or size can't be reused
+    model_key = embedding_model_key(embeddings)
+
+    vectors = {}
+    for h in set(hashes):
+        row = cache.execute(
+            "SELECT vector FROM embeddings WHERE model_id = ? AND hash = ?",
+            (model_key, h)
+        ).fetchone()
+        if row:
+            vectors[h] = np.frombuffer(row[0], dtype=np.float32).tolist()
+    cached_count = sum(1 for h in hashes if h in vectors)
+
+    missing = {h: text for h, text in zip(hashes, texts) if h not in vectors}
+    if missing:
+        new_vectors = embeddings.embed_documents(list(missing.values()))
+        with cache:
+            cache.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+                [(model_key, h, np.asarray(v, dtype=np.float32).tobytes())
+                 for h, v in zip(missing, new_vectors)]
+            )
+        vectors.update(zip(missing, new_vectors))
+
+    return [vectors[h] for h in hashes], cached_count
 
 
 def main():
@@ -18,16 +159,19 @@ def main():
     load_dotenv()
     os.environ["AWS_PROFILE"] = os.getenv("AWS_PROFILE")
 
-    # Create Bedrock client
+    # Create Bedrock client. botocore keeps 10 connections by default; this
+    # keeps one per embedding worker if EMBEDDING_WORKERS is raised past that
     bedrock_client = boto3.client(
         service_name="bedrock-runtime",
-        region_name="us-east-1"
+        region_name="us-east-1",
+        config=Config(max_pool_connections=EMBEDDING_WORKERS)
     )
 
     # Initialize embeddings model
-    embeddings = BedrockEmbeddings(
+    embeddings = ParallelBedrockEmbeddings(
         client=bedrock_client,
-        model_id="amazon.titan-embed-text-v2:0"
+        model_id=EMBEDDING_MODEL_ID,
+        dimensions=EMBEDDING_DIMENSIONS
     )
 
     print("🚀 Starting database loading process...")
@@ -37,54 +181,138 @@ def main():
         print(f"❌ Error: Text file not found at '{OCR_TEXT_PATH}'")
         return
 
+    if os.path.getsize(OCR_TEXT_PATH) == 0:
+        print(f"❌ Error: Text file '{OCR_TEXT_PATH}' is empty")
+        return
+
+    # Memory-map the file so sections are read straight from the page cache
     print(f"📖 Loading text from '{OCR_TEXT_PATH}'...")
-    with open(OCR_TEXT_PATH, 'r', encoding='utf-8') as f:
-        text = f.read()
+    with open(OCR_TEXT_PATH, 'rb') as f:
+        text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
 
     # 2. Parse sections with Regex (for municipal code format like "12.04.010")
     print("📑 Parsing text into sections using Regex...")
-    section_pattern = r'(\d+\.\d+\.\d+)'
-    splits = re.split(section_pattern, text)
-
-    documents = []
-    # Combine the section number with its content
-    for i in range(1, len(splits), 2):
-        if i + 1 < len(splits):
-            section_number = splits[i]
-            content = splits[i + 1]
-            documents.append(
-                Document(page_content=content.strip(), metadata={"section": section_number})
-            )
+    documents = iter_sections(text)
+    first_sections = list(islice(documents, MIN_SECTIONS))
 
-    # 3. Fallback to chunking if Regex parsing is ineffective
-    if len(documents) < 10:
+    # 3. Fallback to chunking if Regex parsing is ineffective.
+    # Chunks are measured in tokens, which is what the embedding model limits.
+    text_splitter = TokenTextSplitter(
+        encoding_name="cl100k_base",
+        chunk_size=CHUNK_TOKENS,
+        chunk_overlap=CHUNK_OVERLAP_TOKENS,
+    )
+    if len(first_sections) < MIN_SECTIONS:
         print("⚠️  Few sections found, using fallback chunking strategy...")
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
+        documents = text_splitter.create_documents([text[:].decode('utf-8')])
+    else:
+        # Long sections are split further; each chunk keeps its section number
+        documents = (
+            chunk
+            for doc in chain(first_sections, documents)
+            for chunk in text_splitter.split_documents([doc])
         )
-        documents = text_splitter.create_documents([text])
 
-    print(f"📄 Created {len(documents)} documents.")
+    # 4. Open the database and see which documents it already has
+    print(f"🗄️  Opening ChromaDB at '{DB_PATH}'...")
+    client = chromadb.PersistentClient(path=DB_PATH)
+    # The collection records which model made its vectors
+    model_key = embedding_model_key(embeddings)
+    collection_metadata = {**HNSW_SETTINGS, "embedding_model": model_key}
+    collection = client.get_or_create_collection(
+        name=COLLECTION_NAME,
+        metadata=collection_metadata
+    )
+    # Vectors from another model or size can't be searched together with new
+    # ones, and index settings only apply to a new collection, so either change
+    # rebuilds it (cached embeddings still apply)
+    changed = [
+        key for key, value in collection_metadata.items()
+        if collection.metadata.get(key) != value
+    ]
+    if changed:
+        print(f"⚠️  Database was built with different {', '.join(changed)}. "
+              "Rebuilding it...")
+        client.delete_collection(COLLECTION_NAME)
+        collection = client.create_collection(
+            name=COLLECTION_NAME,
+            metadata=collection_metadata
+        )
+    # IDs are hashes of the content, so an unchanged section keeps its ID
+    existing_ids = set(collection.get(include=[])["ids"])
+    print(f"📚 Database already has {len(existing_ids):,} documents.")
 
-    # 4. Clear out the old database
-    if os.path.exists(DB_PATH):
-        print("🗑️  Removing existing database...")
-        shutil.rmtree(DB_PATH)
+    # 5. Embed and add only new or changed documents, in batches, reusing
+    # vectors from earlier runs
+    print("⚡ Embedding and adding new documents to the database...")
+    print("This may take a while. Go grab a coffee! ☕")
+    seen_ids = set()
+    added_count = 0
+    cached_count = 0
+    pending_write = None
+    cache = open_embedding_cache()
+    # One background thread writes to ChromaDB while the next batch is embedded
+    writer = ThreadPoolExecutor(max_workers=1)
+    try:
+        for batch in iter_batches(documents, ADD_BATCH_SIZE):
+            # Identical sections would get the same ID, so only the first is kept
+            new_documents = {}
+            for doc in batch:
+                doc_id = document_id(doc)
+                if doc_id not in seen_ids:
+                    seen_ids.add(doc_id)
+                    if doc_id not in existing_ids:
+                        new_documents[doc_id] = doc
+            if not new_documents:
+                continue
 
-    print(f"🗄️  Initializing ChromaDB at '{DB_PATH}'...")
-    db = Chroma(persist_directory=DB_PATH, embedding_function=embeddings)
+            batch = list(new_documents.values())
+            vectors, batch_cached_count = embed_with_cache(
+                [doc.page_content for doc in batch], embeddings, cache
+            )
+            cached_count += batch_cached_count
 
-    # 5. Add documents to the vector store
-    print(f"⚡ Adding {len(documents)} documents to the database...")
-    print("This will take a while. Go grab a coffee! ☕")
-    db.add_documents(documents)
-    print("✅ Documents added successfully.")
+            # Wait for the previous write so batches are added in order
+            if pending_write:
+                pending_write.result()
+            pending_write = writer.submit(
+                collection.add,
+                ids=list(new_documents),
+                embeddings=vectors,
+                documents=[doc.page_content for doc in batch],
+                # ChromaDB rejects empty metadata dicts, e.g. from fallback chunks
+                metadatas=[doc.metadata or None for doc in batch]
+            )
+            added_count += len(batch)
+            print(f"   ...{added_count:,} documents embedded")
+
+        if pending_write:
+            pending_write.result()
+    finally:
+        writer.shutdown()
+        cache.close()
+        text.close()
+
+    # Remove documents whose section was deleted or changed since the last run
+    removed_ids = list(existing_ids - seen_ids)
+    for start in range(0, len(removed_ids), ADD_BATCH_SIZE):
+        collection.delete(ids=removed_ids[start:start + ADD_BATCH_SIZE])
+
+    print(f"📄 Created {len(seen_ids)} documents.")
+    print(f"🔄 Added {added_count:,}, removed {len(removed_ids):,}, "
+          f"kept {len(seen_ids) - added_count:,} unchanged.")
+    print(f"♻️  Reused {cached_count:,} cached embeddings.")
+    print("✅ Database updated successfully.")
 
     # 6. Verify the database
     print("\n🔍 Verifying database...")
     try:
-        collection_count = db._collection.count()
+        db = Chroma(
+            client=client,
+            collection_name=COLLECTION_NAME,
+            embedding_function=embeddings
+        )
+        collection_count = collection.count()
         print(f"✅ Database has {collection_count:,} documents!")
 
         # Run a test similarity search
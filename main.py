@@ -1,14 +1,115 @@
-import boto3
-from dotenv import load_dotenv
 import os
-from langchain_aws import ChatBedrock, BedrockEmbeddings
-from langchain_core.runnables import RunnableParallel, RunnablePassthrough
+import time
+from collections import OrderedDict
+
+import numpy as np
+from dotenv import load_dotenv
+from langchain_aws import ChatBedrock
 from langchain_chroma import Chroma
-from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import PromptTemplate
+
+from bedrock_setup import COLLECTION_NAME, get_bedrock_client, get_embeddings
 
 # --- CONFIGURATION ---
 DB_PATH = "chroma_db"
+CACHE_SIMILARITY_THRESHOLD = 0.95  # How close a new question must be to reuse an answer
+CACHE_MAX_ENTRIES = 500  # Least recently used answers are dropped past this size
+CACHE_TTL_SECONDS = 7 * 24 * 60 * 60  # Cached answers expire after 7 days
+
+
+class SemanticCache:
+    """
+    Remembers (context, answer) pairs keyed by the embedding of the question.
+    A new question that is nearly identical in meaning to a cached one
+    (cosine similarity >= threshold) reuses the cached answer, so rephrased
+    questions don't cost another retrieval and LLM call.
+    """
+
+    def __init__(self, threshold=CACHE_SIMILARITY_THRESHOLD,
+                 max_entries=CACHE_MAX_ENTRIES, ttl_seconds=CACHE_TTL_SECONDS):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # Normalized question embeddings, one per row, allocated once on the
+        # first store so adding and evicting entries never copies the matrix
+        self.vectors = None
+        self.count = 0  # Rows in use; always the first `count` rows
+        self.entries = []  # (context, answer) pairs, parallel to the rows
+        self.created_at = np.zeros(max_entries)
+        self.last_used = np.zeros(max_entries)
+        self.question_vectors = OrderedDict()  # Exact question text -> embedding
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def _remove(self, index):
+        # Move the last row into the gap so the rows in use stay contiguous
+        last = self.count - 1
+        for values in (self.vectors, self.entries, self.created_at, self.last_used):
+            values[index] = values[last]
+        self.entries.pop()
+        self.count -= 1
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl_seconds
+        expired = np.flatnonzero(self.created_at[:self.count] < cutoff)
+        # Highest index first, so moving the last row never moves an expired one
+        for index in expired[::-1]:
+            self._remove(int(index))
+
+    def embed_question(self, question, embeddings):
+        """
+        Returns the question's embedding. Asking the exact same question again
+        reuses the stored vector instead of calling Bedrock.
+        """
+        key = question.strip()
+        if key in self.question_vectors:
+            self.question_vectors.move_to_end(key)
+            return self.question_vectors[key]
+
+        vector = embeddings.embed_query(question)
+        self.question_vectors[key] = vector
+        if len(self.question_vectors) > self.max_entries:
+            self.question_vectors.popitem(last=False)
+        return vector
+
+    def lookup(self, query_vector):
+        """Returns the cached (context, answer) for a similar question, or None."""
+        self._expire()
+        if not self.count:
+            return None
+
+        # Rows are unit length, so one matrix-vector product gives all cosine scores
+        scores = self.vectors[:self.count] @ self._normalize(query_vector)
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+
+        self.last_used[best] = time.time()
+        return self.entries[best]
+
+    def store(self, query_vector, context, answer):
+        """Adds a question's embedding and its (context, answer) to the cache."""
+        row = self._normalize(query_vector)
+        if self.vectors is None:
+            self.vectors = np.zeros((self.max_entries, row.size), dtype=np.float32)
+
+        now = time.time()
+        if self.count < self.max_entries:
+            index = self.count
+            self.count += 1
+            self.entries.append((context, answer))
+        else:
+            # Full: overwrite the least recently used entry in place
+            index = int(np.argmin(self.last_used))
+            self.entries[index] = (context, answer)
+
+        self.vectors[index] = row
+        self.created_at[index] = now
+        self.last_used[index] = now
 
 
 def main():
@@ -17,26 +118,26 @@ def main():
 
     print("Initializing AI Assistant...")
 
-    # Create Bedrock client
-    bedrock_client = boto3.client(
-        service_name="bedrock-runtime",
-        region_name="us-east-1"
-    )
+    # Bedrock client and embeddings (must match what was used in load_to_db.py)
+    bedrock_client = get_bedrock_client()
+    embeddings = get_embeddings()
 
-    # Initialize embeddings (must match what was used in load_to_db.py)
-    embeddings = BedrockEmbeddings(
-        client=bedrock_client,
-        model_id="amazon.titan-embed-text-v2:0"
+    # Connect to ChromaDB
+    db = Chroma(
+        persist_directory=DB_PATH,
+        collection_name=COLLECTION_NAME,
+        embedding_function=embeddings
     )
 
-    # Connect to ChromaDB
-    db = Chroma(persist_directory=DB_PATH, embedding_function=embeddings)
-    retriever = db.as_retriever(search_kwargs={'k': 3})
+    # Answers to previous questions, reused when a question is asked again
+    cache = SemanticCache()
 
     # --- Quick Test of the Retriever ---
     print("\n--- Testing the retriever ---")
     question = "What is the rule for fence height?"
-    retrieved_docs = retriever.invoke(question)
+    retrieved_docs = db.similarity_search_by_vector(
+        cache.embed_question(question, embeddings), k=3
+    )
     print(f"Retriever found {len(retrieved_docs)} documents.")
     if retrieved_docs:
         print("Top result preview:")
@@ -73,16 +174,6 @@ ANSWER:
     # This chain: prompt -> llm -> parse output to string
     answer_chain = prompt | llm | StrOutputParser()
 
-    # Complete chain that returns BOTH the answer AND source documents
-    # RunnableParallel runs retriever and passthrough simultaneously
-    # .assign() adds the LLM answer to the output dictionary
-    rag_chain = (
-        RunnableParallel(
-            context=retriever,
-            question=RunnablePassthrough()
-        ).assign(answer=answer_chain)
-    )
-
     print("\nAI Assistant is ready. Ask a question or type 'exit' to quit.")
 
     # --- Interactive Q&A Loop ---
@@ -91,18 +182,40 @@ ANSWER:
         if user_question.lower() == 'exit':
             break
 
-        response = rag_chain.invoke(user_question)
+        # Embed the question once; the same vector drives the cache and the search
+        query_vector = cache.embed_question(user_question, embeddings)
+
+        cached = cache.lookup(query_vector)
+        if cached:
+            print("\n(Answer from cache)")
+            context, answer = cached
+        else:
+            context = db.similarity_search_by_vector(query_vector, k=3)
+            answer = None
 
-        # Print the sources
+        # Print the sources first, so they show while the answer is generated
         print("\n--- Sources ---")
-        for i, doc in enumerate(response["context"]):
+        for i, doc in enumerate(context):
             section = doc.metadata.get("section", "N/A")
             print(f"{i+1}. Section: {section}")
             print(f"   Content: {doc.page_content[:200]}...")
 
         # Print the answer
         print("\nAssistant's Answer:")
-        print(response["answer"])
+        if answer is not None:
+            print(answer)
+            continue
+
+        # Stream the answer token by token as the LLM generates it
+        chunks = []
+        for chunk in answer_chain.stream(
+            {"context": context, "question": user_question}
+        ):
+            print(chunk, end="", flush=True)
+            chunks.append(chunk)
+        print()
+
+        cache.store(query_vector, context, "".join(chunks))
 
 
 if __name__ == "__main__":